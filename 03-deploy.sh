@@ -334,9 +334,33 @@ if [ "$ALL_RUNNING" = false ]; then
 fi
 
 # -----------------------------------------------------------------------------
-# STEP 5: HEALTH CHECKS
+# STEP 5: ANALYTICS DATABASE SETUP
 # -----------------------------------------------------------------------------
-log_section "${INFO} STEP 5: HEALTH CHECKS"
+log_section "${DATABASE} STEP 5: ANALYTICS DATABASE SETUP"
+
+log_info "Applying analytics indexes and events_daily rollup (idempotent)..."
+
+# Περίμενε να δεχτεί συνδέσεις η Postgres
+for i in $(seq 1 12); do
+    if docker exec geotee_postgres pg_isready -U "${POSTGRES_USER}" -d "${POSTGRES_DB}" > /dev/null 2>&1; then
+        break
+    fi
+    sleep 5
+done
+
+for sql_file in analytics_indexes.sql events_daily_rollup.sql; do
+    if docker exec -i geotee_postgres psql -U "${POSTGRES_USER}" -d "${POSTGRES_DB}" \
+        < "${PROJECT_ROOT}/deployment/postgres/${sql_file}" >> "$DEPLOY_LOG" 2>&1; then
+        log_success "Applied ${sql_file}"
+    else
+        log_warn "Failed to apply ${sql_file} (see $DEPLOY_LOG)"
+    fi
+done
+
+# -----------------------------------------------------------------------------
+# STEP 6: HEALTH CHECKS
+# -----------------------------------------------------------------------------
+log_section "${INFO} STEP 6: HEALTH CHECKS"
 
 # Wait a bit more for services to be fully ready
 sleep 10
@@ -380,9 +404,9 @@ if [ ! -z "${DOMAIN:-}" ]; then
 fi
 
 # -----------------------------------------------------------------------------
-# STEP 6: CREATE BACKUP
+# STEP 7: CREATE BACKUP
 # -----------------------------------------------------------------------------
-log_section "${DATABASE} STEP 6: CREATING BACKUP"
+log_section "${DATABASE} STEP 7: CREATING BACKUP"
 
 BACKUP_TIMESTAMP=$(date +%Y%m%d_%H%M%S)
 
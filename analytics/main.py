@@ -3,24 +3,28 @@ GEOTEE Chatbot Analytics API
 FastAPI backend for real-time analytics and statistics
 """
 
-from fastapi import FastAPI, HTTPException, Query
-from fastapi.responses import FileResponse, HTMLResponse, StreamingResponse
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import FileResponse, HTMLResponse, ORJSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 import redis
-import psycopg2
-from psycopg2.extras import RealDictCursor
-import json
+import asyncpg
+import hashlib
+import orjson
 import csv
 import io
 import os
 
 # Initialize FastAPI
+# ORJSONResponse: ~3-10x γρηγορότερο serialization από το stdlib json,
+# με native υποστήριξη για datetime (σημαντικό για τα rows από Postgres)
 app = FastAPI(
     title="GEOTEE Analytics API",
     description="Real-time analytics for GEOTEE Chatbot",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 # CORS configuration
@@ -40,18 +44,202 @@ redis_client = redis.Redis(
     decode_responses=True
 )
 
-# PostgreSQL connection
-def get_db_connection():
-    """Create PostgreSQL connection"""
-    return psycopg2.connect(
+# PostgreSQL connection pool (asyncpg)
+# Δημιουργείται μία φορά στο startup - κάθε request κάνει acquire από το pool
+# αντί να ανοίγει νέο connection (TCP + auth) και να μπλοκάρει το event loop
+@app.on_event("startup")
+async def create_pg_pool():
+    app.state.pg = await asyncpg.create_pool(
         host=os.getenv('POSTGRES_HOST', 'postgres'),
         port=int(os.getenv('POSTGRES_PORT', 5432)),
         database=os.getenv('POSTGRES_DB', 'geotee_chatbot'),
         user=os.getenv('POSTGRES_USER', 'geotee_user'),
-        password=os.getenv('POSTGRES_PASSWORD', 'geotee_pass')
+        password=os.getenv('POSTGRES_PASSWORD', 'geotee_pass'),
+        min_size=2,
+        max_size=20
     )
 
 
+@app.on_event("shutdown")
+async def close_pg_pool():
+    await app.state.pg.close()
+
+
+DASHBOARD_PATH = os.getenv('DASHBOARD_PATH', '/app/dashboard.html')
+
+
+@app.on_event("startup")
+async def load_dashboard():
+    # Διάβασε το dashboard μία φορά στο startup - όχι syscalls ανά request
+    try:
+        with open(DASHBOARD_PATH, 'rb') as f:
+            app.state.dashboard = f.read()
+        app.state.dashboard_etag = hashlib.md5(app.state.dashboard).hexdigest()
+    except FileNotFoundError:
+        app.state.dashboard = None
+        app.state.dashboard_etag = None
+
+
+# Cache TTLs (seconds) - μικρά ώστε το dashboard polling να μην
+# ξανατρέχει τα βαριά aggregations σε κάθε hit
+CACHE_TTL_TODAY = 30
+CACHE_TTL_LOW_CONF = 60
+CACHE_TTL_SUMMARY = 300
+
+
+def orjson_record_default(obj):
+    """
+    default= hook για το orjson: τα asyncpg Records σειριοποιούνται
+    απευθείας, χωρίς να χτίζουμε ενδιάμεσα dicts per-row στα handlers
+    """
+    if isinstance(obj, asyncpg.Record):
+        return dict(obj)
+    raise TypeError
+
+
+def legacy_intent_counts(date_str: str) -> List:
+    """
+    Dual-read fallback: ημέρες που γράφτηκαν πριν τη μετάβαση στα ZSET
+    υπάρχουν μόνο στο παλιό analytics:intents:{date} hash. Επιστρέφει
+    (intent, count) pairs ταξινομημένα φθίνουσα, όπως το ZREVRANGE.
+    """
+    data = redis_client.hgetall(f"analytics:intents:{date_str}")
+    return sorted(data.items(), key=lambda kv: int(kv[1]), reverse=True)
+
+
+async def get_cached_response(cache_key: str) -> Optional[Response]:
+    """Επιστρέφει cached JSON response από το Redis, αλλιώς None"""
+    try:
+        # Sync redis client - τρέχει στο threadpool για να μην μπλοκάρει το loop
+        cached = await run_in_threadpool(redis_client.get, cache_key)
+    except Exception:
+        return None
+    if cached is None:
+        return None
+    return Response(content=cached, media_type="application/json")
+
+
+async def set_cached_response(cache_key: str, payload: bytes, ttl: int):
+    """Αποθήκευση serialized response στο Redis με TTL"""
+    try:
+        await run_in_threadpool(redis_client.setex, cache_key, ttl, payload)
+    except Exception:
+        pass
+
+
+# -----------------------------------------------------------------------------
+# SQL statements
+# -----------------------------------------------------------------------------
+# Module-level constants ώστε το ίδιο SQL text να περνάει πάντα στο asyncpg:
+# το per-connection statement cache του (prepared statements) κάνει τότε
+# cache hit και το parse/plan δεν ξανατρέχει σε κάθε request.
+
+LOW_CONF_SQL = """
+    SELECT
+        sender_id,
+        data->>'text' as query_text,
+        data->'intent'->>'name' as intent,
+        (data->'intent'->>'confidence')::float as confidence,
+        timestamp
+    FROM events
+    WHERE timestamp >= $1
+        AND timestamp <= $2
+        AND data->'intent'->>'confidence' IS NOT NULL
+        AND (data->'intent'->>'confidence')::float < $3
+    ORDER BY timestamp DESC
+    LIMIT 100
+"""
+
+# LATERAL αντί για DISTINCT ON: το DISTINCT ON ταξινομούσε όλο τον
+# events table - εδώ αγγίζουμε μόνο limit tuples μέσω του
+# events_sender_ts_idx index (βλ. deployment/postgres/analytics_indexes.sql)
+RECENT_CONV_SQL = """
+    SELECT s.sender_id, e.timestamp, e.data->>'text' as last_message
+    FROM (
+        -- Μόνο senders με τουλάχιστον ένα text event - αλλιώς το LATERAL
+        -- τους αδειάζει και γυρνάνε λιγότερα από limit conversations
+        SELECT DISTINCT sender_id
+        FROM events
+        WHERE data->>'text' IS NOT NULL
+        ORDER BY sender_id
+        LIMIT $1
+    ) s
+    CROSS JOIN LATERAL (
+        SELECT timestamp, data
+        FROM events
+        WHERE sender_id = s.sender_id
+            AND data->>'text' IS NOT NULL
+        ORDER BY timestamp DESC
+        LIMIT 1
+    ) e
+"""
+
+CONVERSATION_SQL = """
+    SELECT
+        timestamp,
+        data->>'text' as message,
+        data->'intent'->>'name' as intent,
+        (data->'intent'->>'confidence')::float as confidence
+    FROM events
+    WHERE sender_id = $1
+    ORDER BY timestamp ASC
+"""
+
+# Ένα CTE statement αντί για τρία ξεχωριστά queries:
+# ένα plan, ένα round trip, ένα scan του events
+SUMMARY_SQL = """
+    WITH counts AS (
+        SELECT
+            COUNT(DISTINCT sender_id) AS total_users,
+            COUNT(*) FILTER (WHERE data->>'text' IS NOT NULL) AS total_messages
+        FROM events
+    ), top AS (
+        -- Από το events_daily rollup (βλ. deployment/postgres/
+        -- events_daily_rollup.sql) - όχι jsonb scan στον events
+        SELECT COALESCE(
+            jsonb_agg(jsonb_build_object('intent', intent, 'count', c)),
+            '[]'::jsonb
+        ) AS top_intents
+        FROM (
+            SELECT intent, SUM(c) AS c
+            FROM events_daily
+            WHERE intent IS NOT NULL
+            GROUP BY 1
+            ORDER BY c DESC
+            LIMIT 5
+        ) t
+    )
+    SELECT counts.total_users, counts.total_messages, top.top_intents
+    FROM counts, top
+"""
+
+# Fallback όταν το events_daily δεν έχει γίνει ακόμα apply (το φτιάχνει
+# το 03-deploy.sh) - ίδιο αποτέλεσμα με απευθείας jsonb scan στον events
+SUMMARY_FALLBACK_SQL = """
+    WITH counts AS (
+        SELECT
+            COUNT(DISTINCT sender_id) AS total_users,
+            COUNT(*) FILTER (WHERE data->>'text' IS NOT NULL) AS total_messages
+        FROM events
+    ), top AS (
+        SELECT COALESCE(
+            jsonb_agg(jsonb_build_object('intent', intent, 'count', c)),
+            '[]'::jsonb
+        ) AS top_intents
+        FROM (
+            SELECT data->'intent'->>'name' AS intent, COUNT(*) AS c
+            FROM events
+            WHERE data ? 'intent'
+            GROUP BY 1
+            ORDER BY c DESC
+            LIMIT 5
+        ) t
+    )
+    SELECT counts.total_users, counts.total_messages, top.top_intents
+    FROM counts, top
+"""
+
+
 @app.get("/")
 async def root():
     """Root endpoint"""
@@ -67,15 +255,15 @@ async def health_check():
     """Health check endpoint"""
     try:
         # Test Redis
-        redis_client.ping()
+        await run_in_threadpool(redis_client.ping)
         redis_status = "healthy"
     except Exception as e:
         redis_status = f"unhealthy: {str(e)}"
     
     try:
         # Test PostgreSQL
-        conn = get_db_connection()
-        conn.close()
+        async with app.state.pg.acquire() as conn:
+            await conn.fetchval("SELECT 1")
         postgres_status = "healthy"
     except Exception as e:
         postgres_status = f"unhealthy: {str(e)}"
@@ -92,24 +280,39 @@ async def health_check():
 async def get_today_stats():
     """Get today's statistics from Redis"""
     today = datetime.now().strftime('%Y-%m-%d')
-    
+
+    cache_key = f"cache:today_stats:{today}"
+    cached = await get_cached_response(cache_key)
+    if cached is not None:
+        return cached
+
     try:
-        # Get stats from Redis
-        total_queries = redis_client.hget(f"analytics:daily:{today}", "total_queries") or 0
-        unique_users = redis_client.scard(f"analytics:users:{today}") or 0
-        avg_confidence = redis_client.hget(f"analytics:daily:{today}", "avg_confidence") or 0
-        
-        # Get top intents
-        intents = redis_client.hgetall(f"analytics:intents:{today}")
-        top_intents = sorted(intents.items(), key=lambda x: int(x[1]), reverse=True)[:5]
+        # Get stats from Redis - όλα μαζί σε ένα pipeline (ένα round trip)
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.hget(f"analytics:daily:{today}", "total_queries")
+        pipe.scard(f"analytics:users:{today}")
+        pipe.hget(f"analytics:daily:{today}", "avg_confidence")
+        # Top 5 intents απευθείας από το ZSET - χωρίς sort στην Python
+        pipe.zrevrange(f"analytics:intents_z:{today}", 0, 4, withscores=True)
+        total_queries, unique_users, avg_confidence, top_intents = await run_in_threadpool(pipe.execute)
+
+        # Κενό ZSET: η μέρα μπορεί να προηγείται της μετάβασης στα ZSET
+        if not top_intents:
+            top_intents = (await run_in_threadpool(legacy_intent_counts, today))[:5]
+
+        total_queries = total_queries or 0
+        unique_users = unique_users or 0
+        avg_confidence = avg_confidence or 0
         
-        return {
+        body = orjson.dumps({
             "date": today,
             "total_queries": int(total_queries),
             "unique_users": int(unique_users),
             "avg_confidence": float(avg_confidence),
             "top_intents": [{"intent": k, "count": int(v)} for k, v in top_intents]
-        }
+        })
+        await set_cached_response(cache_key, body, CACHE_TTL_TODAY)
+        return Response(content=body, media_type="application/json")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching stats: {str(e)}")
 
@@ -124,23 +327,31 @@ async def get_stats_range(
         start = datetime.strptime(start_date, '%Y-%m-%d')
         end = datetime.strptime(end_date, '%Y-%m-%d')
         
-        stats = []
+        # Μάζεψε πρώτα όλες τις ημερομηνίες του range
+        dates = []
         current = start
-        
         while current <= end:
-            date_str = current.strftime('%Y-%m-%d')
-            
-            total_queries = redis_client.hget(f"analytics:daily:{date_str}", "total_queries") or 0
-            unique_users = redis_client.scard(f"analytics:users:{date_str}") or 0
-            
+            dates.append(current.strftime('%Y-%m-%d'))
+            current += timedelta(days=1)
+
+        # Ένα pipeline για όλες τις μέρες - ένα round trip στο Redis
+        pipe = redis_client.pipeline(transaction=False)
+        for date_str in dates:
+            pipe.hget(f"analytics:daily:{date_str}", "total_queries")
+            pipe.scard(f"analytics:users:{date_str}")
+        results = await run_in_threadpool(pipe.execute)
+
+        stats = []
+        for i, date_str in enumerate(dates):
+            total_queries = results[2 * i] or 0
+            unique_users = results[2 * i + 1] or 0
+
             stats.append({
                 "date": date_str,
                 "total_queries": int(total_queries),
                 "unique_users": int(unique_users)
             })
-            
-            current += timedelta(days=1)
-        
+
         return {"stats": stats}
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
@@ -154,15 +365,16 @@ async def get_today_intents():
     today = datetime.now().strftime('%Y-%m-%d')
     
     try:
-        intents = redis_client.hgetall(f"analytics:intents:{today}")
-        
-        # Sort by count
-        sorted_intents = sorted(
-            intents.items(),
-            key=lambda x: int(x[1]),
-            reverse=True
+        # Ήδη ταξινομημένα από το ZSET (φθίνουσα σειρά score)
+        sorted_intents = await run_in_threadpool(
+            redis_client.zrevrange,
+            f"analytics:intents_z:{today}", 0, -1, withscores=True
         )
-        
+
+        # Κενό ZSET: η μέρα μπορεί να προηγείται της μετάβασης στα ZSET
+        if not sorted_intents:
+            sorted_intents = await run_in_threadpool(legacy_intent_counts, today)
+
         return {
             "date": today,
             "intents": [
@@ -180,42 +392,28 @@ async def get_low_confidence_queries(
     threshold: float = Query(0.6, description="Confidence threshold")
 ):
     """Get queries with low confidence scores"""
+    cache_key = f"cache:low_conf:{days}:{threshold}"
+    cached = await get_cached_response(cache_key)
+    if cached is not None:
+        return cached
+
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        
         # Calculate date range
         end_date = datetime.now()
         start_date = end_date - timedelta(days=days)
-        
-        query = """
-            SELECT 
-                sender_id,
-                data->>'text' as query_text,
-                data->>'intent'->>'name' as intent,
-                CAST(data->>'intent'->>'confidence' AS FLOAT) as confidence,
-                timestamp
-            FROM events
-            WHERE timestamp >= %s 
-                AND timestamp <= %s
-                AND data->>'intent'->>'confidence' IS NOT NULL
-                AND CAST(data->>'intent'->>'confidence' AS FLOAT) < %s
-            ORDER BY timestamp DESC
-            LIMIT 100
-        """
-        
-        cursor.execute(query, (start_date, end_date, threshold))
-        results = cursor.fetchall()
-        
-        cursor.close()
-        conn.close()
-        
-        return {
+
+        async with app.state.pg.acquire() as conn:
+            rows = await conn.fetch(LOW_CONF_SQL, start_date, end_date, threshold)
+
+        # Serialization μία φορά με orjson - ίδιο payload πάει και στο cache
+        body = orjson.dumps({
             "days": days,
             "threshold": threshold,
-            "count": len(results),
-            "queries": results
-        }
+            "count": len(rows),
+            "queries": rows
+        }, default=orjson_record_default)
+        await set_cached_response(cache_key, body, CACHE_TTL_LOW_CONF)
+        return Response(content=body, media_type="application/json")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching low confidence queries: {str(e)}")
 
@@ -226,65 +424,45 @@ async def get_recent_conversations(
 ):
     """Get recent conversations"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        
-        query = """
-            SELECT DISTINCT ON (sender_id)
-                sender_id,
-                timestamp,
-                data->>'text' as last_message
-            FROM events
-            WHERE data->>'text' IS NOT NULL
-            ORDER BY sender_id, timestamp DESC
-            LIMIT %s
-        """
-        
-        cursor.execute(query, (limit,))
-        results = cursor.fetchall()
-        
-        cursor.close()
-        conn.close()
-        
-        return {
-            "count": len(results),
-            "conversations": results
-        }
+        async with app.state.pg.acquire() as conn:
+            rows = await conn.fetch(RECENT_CONV_SQL, limit)
+
+        return Response(
+            content=orjson.dumps({
+                "count": len(rows),
+                "conversations": rows
+            }, default=orjson_record_default),
+            media_type="application/json"
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching conversations: {str(e)}")
 
 
 @app.get("/api/conversation/{sender_id}")
 async def get_conversation(sender_id: str):
-    """Get full conversation history for a user"""
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        
-        query = """
-            SELECT 
-                timestamp,
-                data->>'text' as message,
-                data->>'intent'->>'name' as intent,
-                CAST(data->>'intent'->>'confidence' AS FLOAT) as confidence
-            FROM events
-            WHERE sender_id = %s
-            ORDER BY timestamp ASC
-        """
-        
-        cursor.execute(query, (sender_id,))
-        results = cursor.fetchall()
-        
-        cursor.close()
-        conn.close()
-        
-        return {
-            "sender_id": sender_id,
-            "message_count": len(results),
-            "messages": results
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error fetching conversation: {str(e)}")
+    """Get full conversation history for a user (streamed JSON array)"""
+    # Acquire πριν φτιαχτεί το StreamingResponse: αν το pool είναι κάτω
+    # ο client παίρνει κανονικό 500, όχι 200 με κομμένο body
+    conn = await app.state.pg.acquire()
+
+    async def stream_messages():
+        """Stream το JSON array χωρίς να φορτωθεί όλο το history στη μνήμη"""
+        try:
+            # Το asyncpg cursor θέλει transaction - φέρνει rows σε chunks
+            async with conn.transaction():
+                yield b'{"sender_id":' + orjson.dumps(sender_id) + b',"messages":['
+                first = True
+                async for row in conn.cursor(CONVERSATION_SQL, sender_id, prefetch=500):
+                    if first:
+                        first = False
+                    else:
+                        yield b','
+                    yield orjson.dumps(row, default=orjson_record_default)
+                yield b']}'
+        finally:
+            await app.state.pg.release(conn)
+
+    return StreamingResponse(stream_messages(), media_type="application/json")
 
 
 @app.get("/api/export/csv")
@@ -295,47 +473,76 @@ async def export_csv(
     try:
         end_date = datetime.now()
         start_date = end_date - timedelta(days=days)
-        
-        # Prepare CSV data
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # Write header
-        writer.writerow([
-            'Ημερομηνία',
-            'Συνολικά Ερωτήματα',
-            'Μοναδικοί Χρήστες',
-            'Μέση Εμπιστοσύνη',
-            'Κορυφαία Intent'
-        ])
-        
-        # Write data
+
+        # Μάζεψε τις ημερομηνίες του range
+        dates = []
         current = start_date
         while current <= end_date:
-            date_str = current.strftime('%Y-%m-%d')
-            
-            total_queries = redis_client.hget(f"analytics:daily:{date_str}", "total_queries") or 0
-            unique_users = redis_client.scard(f"analytics:users:{date_str}") or 0
-            avg_confidence = redis_client.hget(f"analytics:daily:{date_str}", "avg_confidence") or 0
-            
-            # Get top intent
-            intents = redis_client.hgetall(f"analytics:intents:{date_str}")
-            top_intent = max(intents.items(), key=lambda x: int(x[1]))[0] if intents else "N/A"
-            
-            writer.writerow([
-                date_str,
-                int(total_queries),
-                int(unique_users),
-                float(avg_confidence),
-                top_intent
-            ])
-            
+            dates.append(current.strftime('%Y-%m-%d'))
             current += timedelta(days=1)
-        
-        # Prepare response
-        output.seek(0)
+
+        async def generate_rows():
+            """Stream μία CSV γραμμή τη φορά - O(1) μνήμη, σταθερό TTFB"""
+            # Ένα StringIO ανά stream, reset μετά από κάθε γραμμή
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+
+            def render_row(row):
+                writer.writerow(row)
+                value = buffer.getvalue()
+                buffer.truncate(0)
+                buffer.seek(0)
+                return value
+
+            # Header
+            yield render_row([
+                'Ημερομηνία',
+                'Συνολικά Ερωτήματα',
+                'Μοναδικοί Χρήστες',
+                'Μέση Εμπιστοσύνη',
+                'Κορυφαία Intent'
+            ])
+
+            # Διάβασε τα πάντα με ένα pipeline (4 entries ανά ημερομηνία)
+            pipe = redis_client.pipeline(transaction=False)
+            for date_str in dates:
+                pipe.hget(f"analytics:daily:{date_str}", "total_queries")
+                pipe.scard(f"analytics:users:{date_str}")
+                pipe.hget(f"analytics:daily:{date_str}", "avg_confidence")
+                pipe.zrevrange(f"analytics:intents_z:{date_str}", 0, 0)
+            results = await run_in_threadpool(pipe.execute)
+
+            # Dual-read για τις προ-ZSET ημέρες: ένα δεύτερο pipeline
+            # μόνο για τις ημερομηνίες με κενό ZSET
+            missing = [i for i in range(len(dates)) if not results[4 * i + 3]]
+            if missing:
+                legacy_pipe = redis_client.pipeline(transaction=False)
+                for i in missing:
+                    legacy_pipe.hgetall(f"analytics:intents:{dates[i]}")
+                legacy = await run_in_threadpool(legacy_pipe.execute)
+                for i, counts in zip(missing, legacy):
+                    if counts:
+                        results[4 * i + 3] = [max(counts, key=lambda k: int(counts[k]))]
+
+            for i, date_str in enumerate(dates):
+                total_queries = results[4 * i] or 0
+                unique_users = results[4 * i + 1] or 0
+                avg_confidence = results[4 * i + 2] or 0
+                top_intent_row = results[4 * i + 3]
+
+                # Get top intent (το πρώτο στοιχείο του ZREVRANGE)
+                top_intent = top_intent_row[0] if top_intent_row else "N/A"
+
+                yield render_row([
+                    date_str,
+                    int(total_queries),
+                    int(unique_users),
+                    float(avg_confidence),
+                    top_intent
+                ])
+
         return StreamingResponse(
-            iter([output.getvalue()]),
+            generate_rows(),
             media_type="text/csv",
             headers={
                 "Content-Disposition": f"attachment; filename=geotee_analytics_{start_date.strftime('%Y%m%d')}_{end_date.strftime('%Y%m%d')}.csv"
@@ -348,40 +555,35 @@ async def export_csv(
 @app.get("/api/summary")
 async def get_summary():
     """Get overall summary statistics"""
+    cache_key = "cache:summary"
+    cached = await get_cached_response(cache_key)
+    if cached is not None:
+        return cached
+
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        
-        # Total conversations
-        cursor.execute("SELECT COUNT(DISTINCT sender_id) FROM events")
-        total_users = cursor.fetchone()['count']
-        
-        # Total messages
-        cursor.execute("SELECT COUNT(*) FROM events WHERE data->>'text' IS NOT NULL")
-        total_messages = cursor.fetchone()['count']
-        
-        # Most common intents (all time)
-        cursor.execute("""
-            SELECT 
-                data->>'intent'->>'name' as intent,
-                COUNT(*) as count
-            FROM events
-            WHERE data->>'intent'->>'name' IS NOT NULL
-            GROUP BY intent
-            ORDER BY count DESC
-            LIMIT 5
-        """)
-        top_intents = cursor.fetchall()
-        
-        cursor.close()
-        conn.close()
-        
-        # Today's stats
+        async with app.state.pg.acquire() as conn:
+            try:
+                row = await conn.fetchrow(SUMMARY_SQL)
+            except asyncpg.UndefinedTableError:
+                # Deployment χωρίς το events_daily rollup - πιο αργό
+                # αλλά το endpoint δουλεύει out of the box
+                row = await conn.fetchrow(SUMMARY_FALLBACK_SQL)
+
+        total_users = row['total_users']
+        total_messages = row['total_messages']
+        # Το jsonb έρχεται ως string από το asyncpg
+        top_intents = orjson.loads(row['top_intents'])
+
+        # Today's stats - ένα pipeline αντί για δύο ξεχωριστά calls
         today = datetime.now().strftime('%Y-%m-%d')
-        today_queries = redis_client.hget(f"analytics:daily:{today}", "total_queries") or 0
-        today_users = redis_client.scard(f"analytics:users:{today}") or 0
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.hget(f"analytics:daily:{today}", "total_queries")
+        pipe.scard(f"analytics:users:{today}")
+        today_queries, today_users = await run_in_threadpool(pipe.execute)
+        today_queries = today_queries or 0
+        today_users = today_users or 0
         
-        return {
+        body = orjson.dumps({
             "all_time": {
                 "total_users": total_users,
                 "total_messages": total_messages,
@@ -391,20 +593,32 @@ async def get_summary():
                 "queries": int(today_queries),
                 "users": int(today_users)
             }
-        }
+        })
+        await set_cached_response(cache_key, body, CACHE_TTL_SUMMARY)
+        return Response(content=body, media_type="application/json")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching summary: {str(e)}")
 
 
 @app.get("/dashboard", response_class=HTMLResponse)
-async def serve_dashboard():
-    """Serve the analytics dashboard"""
-    try:
-        with open('/app/dashboard.html', 'r', encoding='utf-8') as f:
-            return f.read()
-    except FileNotFoundError:
+async def serve_dashboard(request: Request):
+    """Serve the analytics dashboard (cached in memory από το startup)"""
+    if app.state.dashboard is None:
         raise HTTPException(status_code=404, detail="Dashboard not found")
 
+    # Conditional GET: το dashboard polling παίρνει 304 χωρίς body
+    if request.headers.get('if-none-match') == app.state.dashboard_etag:
+        return Response(status_code=304)
+
+    return Response(
+        content=app.state.dashboard,
+        media_type="text/html; charset=utf-8",
+        headers={
+            "Cache-Control": "public, max-age=60",
+            "ETag": app.state.dashboard_etag
+        }
+    )
+
 
 if __name__ == "__main__":
     import uvicorn
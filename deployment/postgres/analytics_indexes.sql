@@ -0,0 +1,23 @@
+-- =============================================================================
+-- GEOTEE Chatbot - Analytics indexes για τον events table του Rasa tracker
+-- =============================================================================
+-- Τρέξε μία φορά στη βάση geotee_chatbot:
+--   docker exec -i geotee_postgres psql -U geotee_user -d geotee_chatbot < analytics_indexes.sql
+--
+-- Υποστηρίζουν τα queries του analytics API (main.py):
+--   * GROUP BY στο intent name (get_summary)
+--   * time-range filters σε events με intent (get_low_confidence_queries)
+
+-- Expression index πάνω στο jsonb path του intent name
+CREATE INDEX IF NOT EXISTS events_intent_name_idx
+    ON events ((data->'intent'->>'name'));
+
+-- Partial index για time-range queries σε events που έχουν intent
+CREATE INDEX IF NOT EXISTS events_ts_intent_idx
+    ON events (timestamp DESC)
+    WHERE data ? 'intent';
+
+-- Composite index για το LATERAL lookup των πρόσφατων conversations
+-- (τελευταίο μήνυμα ανά sender_id με index-only scan)
+CREATE INDEX IF NOT EXISTS events_sender_ts_idx
+    ON events (sender_id, timestamp DESC);
@@ -0,0 +1,31 @@
+-- =============================================================================
+-- GEOTEE Chatbot - Ημερήσιο rollup των events για τα analytics
+-- =============================================================================
+-- Τα aggregation endpoints σάρωναν ολόκληρο τον events table εξάγοντας jsonb
+-- πεδία σε κάθε request. Το events_daily κρατάει προ-υπολογισμένα counts ανά
+-- (μέρα, intent) ώστε τα queries να γίνονται index seek σε έναν μικρό πίνακα.
+--
+-- Αρχικό setup:
+--   docker exec -i geotee_postgres psql -U geotee_user -d geotee_chatbot < events_daily_rollup.sql
+
+CREATE MATERIALIZED VIEW IF NOT EXISTS events_daily AS
+SELECT
+    date_trunc('day', timestamp) AS d,
+    data->'intent'->>'name' AS intent,
+    COUNT(*) AS c,
+    AVG((data->'intent'->>'confidence')::float) AS conf
+FROM events
+WHERE data ? 'intent'
+GROUP BY 1, 2;
+
+-- Unique index: απαραίτητο για REFRESH ... CONCURRENTLY
+CREATE UNIQUE INDEX IF NOT EXISTS events_daily_d_intent_idx
+    ON events_daily (d, intent);
+
+-- Refresh (νυχτερινό) - βάλε σε crontab του host ή σε pg_cron:
+--   0 3 * * * docker exec geotee_postgres psql -U geotee_user -d geotee_chatbot \
+--       -c "REFRESH MATERIALIZED VIEW CONCURRENTLY events_daily;"
+--
+-- ή με pg_cron:
+--   SELECT cron.schedule('refresh-events-daily', '0 3 * * *',
+--       'REFRESH MATERIALIZED VIEW CONCURRENTLY events_daily');
@@ -10,6 +10,10 @@ GEOTEE Chatbot - Custom Actions
 
 import os
 import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
 from typing import Any, Text, Dict, List
 from datetime import datetime, timedelta
 
@@ -17,8 +21,10 @@ from rasa_sdk import Action, Tracker
 from rasa_sdk.executor import CollectingDispatcher
 from rasa_sdk.events import SlotSet, SessionStarted, ActionExecuted
 
+import numpy as np
 import redis
 from qdrant_client import QdrantClient
+from qdrant_client.models import SearchRequest
 from sentence_transformers import SentenceTransformer
 import psycopg2
 from langdetect import detect, LangDetectException
@@ -33,11 +39,35 @@ QDRANT_HOST = os.getenv('QDRANT_HOST', 'qdrant')
 QDRANT_PORT = int(os.getenv('QDRANT_PORT', 6333))
 MAX_QUERIES = int(os.getenv('MAX_QUERIES_PER_SESSION', 10))
 SESSION_TIMEOUT = int(os.getenv('SESSION_TIMEOUT_MINUTES', 60))
+ANALYTICS_RETENTION_DAYS = int(os.getenv('ANALYTICS_RETENTION_DAYS', 90))
+EMBED_BATCH_SIZE = int(os.getenv('EMBED_BATCH_SIZE', 64))
+EMBED_BATCH_WINDOW_MS = int(os.getenv('EMBED_BATCH_WINDOW_MS', 8))
+EMBEDDING_MODEL_NAME = 'paraphrase-multilingual-MiniLM-L12-v2'
+# INT8 ONNX export του ίδιου model - βλ. σχόλια στο OnnxEmbedder
+EMBEDDING_ONNX_MODEL = os.getenv(
+    'EMBEDDING_ONNX_MODEL',
+    '/app/models/paraphrase-multilingual-MiniLM-L12-v2.int8.onnx'
+)
+# fasttext LID model (176 γλώσσες, ~900KB):
+# wget https://dl.fbaipublicfiles.com/fasttext/supervised-models/lid.176.ftz
+FASTTEXT_LID_MODEL = os.getenv('FASTTEXT_LID_MODEL', '/app/models/lid.176.ftz')
 
 # Initialize clients (singleton pattern)
 redis_client = None
 qdrant_client = None
 embedding_model = None
+rate_limit_script = None
+language_detector = None
+
+# Atomic check-and-increment για το rate limiting: INCR + EXPIRE στο πρώτο
+# hit, όλα server-side σε ένα round trip - χωρίς race ανάμεσα σε GET/SETEX
+RATE_LIMIT_LUA = """
+local c = redis.call('INCR', KEYS[1])
+if c == 1 then
+    redis.call('EXPIRE', KEYS[1], ARGV[1])
+end
+return c
+"""
 
 
 def get_redis_client():
@@ -53,6 +83,47 @@ def get_redis_client():
     return redis_client
 
 
+def get_language_detector():
+    """Get fasttext LID model (singleton) - None αν δεν είναι διαθέσιμο"""
+    global language_detector
+    if language_detector is None:
+        try:
+            import fasttext
+            language_detector = fasttext.load_model(FASTTEXT_LID_MODEL)
+            logger.info(f"Loaded fasttext LID model: {FASTTEXT_LID_MODEL}")
+        except Exception as e:
+            logger.warning(f"fasttext LID unavailable, falling back to langdetect: {e}")
+            language_detector = False  # Μην ξαναπροσπαθήσεις σε κάθε μήνυμα
+    return language_detector or None
+
+
+def detect_language(text: str):
+    """
+    Ανίχνευση γλώσσας - fasttext (C++, <100µs, deterministic) όταν υπάρχει
+    το lid.176 model, αλλιώς langdetect. Επιστρέφει ISO code ή None.
+    """
+    lid = get_language_detector()
+    if lid is not None:
+        labels, _ = lid.predict(text.replace('\n', ' '), k=1)
+        if labels:
+            return labels[0].replace('__label__', '')
+        return None
+
+    try:
+        return detect(text)
+    except LangDetectException:
+        return None
+
+
+def get_rate_limit_script():
+    """Get registered rate-limit Lua script (singleton)"""
+    global rate_limit_script
+    if rate_limit_script is None:
+        # Το register_script κάνει EVALSHA και ξαναφορτώνει σε NOSCRIPT
+        rate_limit_script = get_redis_client().register_script(RATE_LIMIT_LUA)
+    return rate_limit_script
+
+
 def get_qdrant_client():
     """Get Qdrant client (singleton)"""
     global qdrant_client
@@ -65,32 +136,231 @@ def get_qdrant_client():
     return qdrant_client
 
 
+class OnnxEmbedder:
+    """
+    INT8 ONNX encoder για το MiniLM - ίδιο encode() interface με το
+    SentenceTransformer αλλά 3-5x γρηγορότερο σε CPU (VNNI int8 GEMMs).
+
+    One-time export του model:
+        optimum-cli export onnx \\
+            --model sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2 out/
+        python -c "from onnxruntime.quantization import quantize_dynamic, QuantType; \\
+            quantize_dynamic('out/model.onnx', 'model.int8.onnx', weight_type=QuantType.QInt8)"
+    """
+
+    def __init__(self, model_path: str, model_name: str = EMBEDDING_MODEL_NAME):
+        import onnxruntime
+        from transformers import AutoTokenizer
+
+        self.tokenizer = AutoTokenizer.from_pretrained(f'sentence-transformers/{model_name}')
+        self.session = onnxruntime.InferenceSession(
+            model_path,
+            providers=['CPUExecutionProvider']
+        )
+        self._input_names = {i.name for i in self.session.get_inputs()}
+
+    def encode(self, sentences, batch_size: int = 64,
+               convert_to_numpy: bool = True, show_progress_bar: bool = False):
+        """Tokenize + forward + mean pooling + L2 normalize"""
+        single = isinstance(sentences, str)
+        if single:
+            sentences = [sentences]
+
+        encoded = self.tokenizer(
+            sentences,
+            padding=True,
+            truncation=True,
+            max_length=512,
+            return_tensors='np'
+        )
+        inputs = {k: v for k, v in encoded.items() if k in self._input_names}
+
+        # Token embeddings από το ONNX session
+        token_embeddings = self.session.run(None, inputs)[0]
+
+        # Mean pooling με βάση το attention mask
+        mask = encoded['attention_mask'][:, :, None].astype(np.float32)
+        embeddings = (token_embeddings * mask).sum(axis=1) / np.clip(
+            mask.sum(axis=1), 1e-9, None
+        )
+
+        # L2 normalize (το cosine distance στο Qdrant μένει ίδιο)
+        embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+        embeddings = embeddings.astype(np.float32)
+
+        return embeddings[0] if single else embeddings
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.session.get_outputs()[0].shape[-1]
+
+
 def get_embedding_model():
-    """Get sentence transformer model (singleton)"""
+    """Get embedding model (singleton) - INT8 ONNX αν υπάρχει, αλλιώς torch"""
     global embedding_model
     if embedding_model is None:
-        embedding_model = SentenceTransformer('paraphrase-multilingual-MiniLM-L12-v2')
+        if os.path.exists(EMBEDDING_ONNX_MODEL):
+            try:
+                embedding_model = OnnxEmbedder(EMBEDDING_ONNX_MODEL)
+                logger.info(f"Loaded INT8 ONNX embedding model: {EMBEDDING_ONNX_MODEL}")
+
+                # Το encode τρέχει στο onnxruntime - κράτα το torch σε ένα
+                # thread ώστε να μην ανταγωνίζεται τα ORT threads
+                try:
+                    import torch
+                    torch.set_num_threads(1)
+                except ImportError:
+                    pass
+
+                return embedding_model
+            except Exception as e:
+                logger.warning(f"Failed to load ONNX model, falling back to torch: {e}")
+
+        # Torch fallback: τα encodes έρχονται σειριακά από το rasa-sdk
+        # event loop - άφησε το default threading να τα παραλληλίσει
+        embedding_model = SentenceTransformer(EMBEDDING_MODEL_NAME)
     return embedding_model
 
 
+class EmbeddingBatcher:
+    """
+    Micro-batching για τα query embeddings και τα Qdrant searches.
+    Μαζεύει concurrent requests μέσα σε ένα μικρό χρονικό παράθυρο, τα
+    περνάει όλα μαζί σε ένα model.encode() call (το batched matmul κοστίζει
+    ελάχιστα περισσότερο από ένα μόνο sentence) και στέλνει τα αντίστοιχα
+    vectors με ένα search_batch αντί για Ν ξεχωριστά HTTP calls.
+    """
+
+    def __init__(self, batch_size: int = EMBED_BATCH_SIZE,
+                 window_ms: int = EMBED_BATCH_WINDOW_MS):
+        self._queue = queue.Queue()
+        self._batch_size = batch_size
+        self._window = window_ms / 1000.0
+        self._worker = None
+        self._lock = threading.Lock()
+
+    def submit(self, text: str, search_params: Dict = None) -> Future:
+        """
+        Βάζει ένα text στην ουρά. Χωρίς search_params το Future γυρίζει το
+        embedding - με search_params (limit, score_threshold) γυρίζει
+        απευθείας τα Qdrant results.
+        """
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((text, search_params, future))
+        return future
+
+    def encode(self, text: str):
+        """Συγχρονισμένο helper: submit + αναμονή για το embedding"""
+        return self.submit(text).result()
+
+    def search(self, text: str, limit: int, score_threshold: float):
+        """Συγχρονισμένο helper: encode + batched Qdrant search"""
+        return self.submit(
+            text,
+            {'limit': limit, 'score_threshold': score_threshold}
+        ).result()
+
+    def _ensure_worker(self):
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run, name="embedding-batcher", daemon=True
+                )
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            # Περίμενε το πρώτο request, μετά άφησε το παράθυρο να γεμίσει
+            batch = [self._queue.get()]
+            time.sleep(self._window)
+            while len(batch) < self._batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            texts = [text for text, _, _ in batch]
+            try:
+                embeddings = get_embedding_model().encode(
+                    texts,
+                    batch_size=self._batch_size,
+                    convert_to_numpy=True,
+                    show_progress_bar=False
+                )
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            # Τα searches του batch πάνε όλα μαζί σε ένα search_batch call
+            searches = [
+                (i, params, future)
+                for i, (_, params, future) in enumerate(batch)
+                if params is not None
+            ]
+            if searches:
+                try:
+                    requests = [
+                        SearchRequest(
+                            vector=embeddings[i].tolist(),
+                            limit=params['limit'],
+                            score_threshold=params['score_threshold'],
+                            with_payload=True
+                        )
+                        for i, params, _ in searches
+                    ]
+                    results = get_qdrant_client().search_batch(
+                        collection_name='geotee_kb',
+                        requests=requests
+                    )
+                    for (_, _, future), result in zip(searches, results):
+                        future.set_result(result)
+                except Exception as e:
+                    for _, _, future in searches:
+                        future.set_exception(e)
+
+            # Όσα requests ήθελαν μόνο embedding
+            for i, (_, params, future) in enumerate(batch):
+                if params is None:
+                    future.set_result(embeddings[i])
+
+
+embedding_batcher = EmbeddingBatcher()
+
+
 def track_analytics(sender_id: str, intent: str, confidence: float):
     """Track analytics in Redis"""
     try:
         redis_conn = get_redis_client()
         today = datetime.now().strftime('%Y-%m-%d')
-        
+
+        # Όλα τα writes σε ένα pipeline - ένα round trip αντί για τέσσερα
+        pipe = redis_conn.pipeline(transaction=False)
+
         # Increment total queries
-        redis_conn.hincrby(f"analytics:daily:{today}", "total_queries", 1)
-        
+        pipe.hincrby(f"analytics:daily:{today}", "total_queries", 1)
+
         # Add unique user
-        redis_conn.sadd(f"analytics:users:{today}", sender_id)
-        
-        # Track intent
-        redis_conn.hincrby(f"analytics:intents:{today}", intent, 1)
-        
+        pipe.sadd(f"analytics:users:{today}", sender_id)
+
+        # Track intent (ZSET - τα top intents διαβάζονται με ZREVRANGE
+        # χωρίς sort στην Python πλευρά)
+        pipe.zincrby(f"analytics:intents_z:{today}", 1, intent)
+
         # Update average confidence (simplified)
-        redis_conn.hincrbyfloat(f"analytics:daily:{today}", "avg_confidence", confidence)
-        
+        pipe.hincrbyfloat(f"analytics:daily:{today}", "avg_confidence", confidence)
+
+        # TTL στα daily keys ώστε να καθαρίζονται μόνα τους - rolling window
+        # αντί να μεγαλώνει το Redis memory για πάντα (ίδιο pipeline, 0 RTT)
+        expire_at = int((datetime.now() + timedelta(days=ANALYTICS_RETENTION_DAYS)).timestamp())
+        pipe.expireat(f"analytics:daily:{today}", expire_at)
+        pipe.expireat(f"analytics:users:{today}", expire_at)
+        pipe.expireat(f"analytics:intents_z:{today}", expire_at)
+
+        pipe.execute()
+
     except Exception as e:
         logger.error(f"Failed to track analytics: {e}")
 
@@ -164,46 +434,30 @@ class ActionCheckRateLimit(Action):
             domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
         
         sender_id = tracker.sender_id
-        redis_conn = get_redis_client()
-        
+
         try:
             session_key = f"session:{sender_id}"
-            
-            # Έλεγχος αριθμού queries στο session
-            query_count = redis_conn.get(session_key)
-            
-            if query_count is None:
-                # Πρώτο query - initialize counter
-                redis_conn.setex(
-                    session_key,
-                    SESSION_TIMEOUT * 60,
-                    1
-                )
-                return [
-                    SlotSet("rate_limited", False),
-                    SlotSet("session_queries_count", 1)
-                ]
-            
-            query_count = int(query_count)
-            
-            if query_count >= MAX_QUERIES:
+
+            # Atomic check-and-increment server-side (ένα round trip, race-free)
+            query_count = int(get_rate_limit_script()(
+                keys=[session_key],
+                args=[SESSION_TIMEOUT * 60]
+            ))
+
+            if query_count > MAX_QUERIES:
                 # Rate limit exceeded
                 logger.warning(f"Rate limit exceeded for user {sender_id}")
                 dispatcher.utter_message(response="utter_rate_limit_exceeded")
                 return [
                     SlotSet("rate_limited", True),
-                    SlotSet("session_queries_count", query_count)
+                    SlotSet("session_queries_count", MAX_QUERIES)
                 ]
-            
-            # Increment counter
-            redis_conn.incr(session_key)
-            query_count += 1
-            
+
             return [
                 SlotSet("rate_limited", False),
                 SlotSet("session_queries_count", query_count)
             ]
-        
+
         except Exception as e:
             logger.error(f"Error checking rate limit: {e}")
             # Αν υπάρχει σφάλμα, επίτρεψε το query
@@ -221,20 +475,14 @@ class ActionDetectLanguage(Action):
             domain: Dict[Text, Any]) -> List[Dict[Text, Any]]:
         
         user_message = tracker.latest_message.get('text', '')
-        
-        try:
-            # Detect language
-            detected_lang = detect(user_message)
-            
-            if detected_lang != 'el':  # el = Greek
-                logger.info(f"Non-Greek language detected: {detected_lang}")
-                dispatcher.utter_message(response="utter_english_not_supported")
-                return []
-            
-        except LangDetectException:
-            # Αν δεν μπορεί να ανιχνεύσει, συνέχισε κανονικά
-            pass
-        
+
+        # Detect language (None = δεν μπόρεσε να ανιχνεύσει, συνέχισε κανονικά)
+        detected_lang = detect_language(user_message)
+
+        if detected_lang is not None and detected_lang != 'el':  # el = Greek
+            logger.info(f"Non-Greek language detected: {detected_lang}")
+            dispatcher.utter_message(response="utter_english_not_supported")
+
         return []
 
 
@@ -256,21 +504,14 @@ class ActionSearchKnowledgeBase(Action):
         track_analytics(tracker.sender_id, intent, confidence)
         
         try:
-            # Get Qdrant client and model
-            qdrant = get_qdrant_client()
-            model = get_embedding_model()
-            
-            # Create embedding για το user query
-            query_vector = model.encode(user_message).tolist()
-            
-            # Search στο Qdrant
-            search_results = qdrant.search(
-                collection_name='geotee_kb',
-                query_vector=query_vector,
+            # Encode + search μέσω του micro-batcher: concurrent turns
+            # μοιράζονται ένα encode() και ένα search_batch() call
+            search_results = embedding_batcher.search(
+                user_message,
                 limit=3,  # Top 3 results
                 score_threshold=0.5  # Minimum similarity score
             )
-            
+
             if not search_results:
                 logger.info(f"No results found for query: {user_message}")
                 dispatcher.utter_message(response="utter_no_results_found")
@@ -342,18 +583,12 @@ class ActionDefaultFallback(Action):
         
         # Προσπάθησε να ψάξεις στο knowledge base anyway
         try:
-            qdrant = get_qdrant_client()
-            model = get_embedding_model()
-            
-            query_vector = model.encode(user_message).tolist()
-            
-            search_results = qdrant.search(
-                collection_name='geotee_kb',
-                query_vector=query_vector,
+            search_results = embedding_batcher.search(
+                user_message,
                 limit=1,
                 score_threshold=0.3  # Lower threshold για fallback
             )
-            
+
             if search_results and search_results[0].score > 0.4:
                 # Αν βρέθηκε κάτι σχετικό
                 payload = search_results[0].payload
@@ -59,8 +59,10 @@ DOWNLOADER_MIDDLEWARES = {
 # Configure item pipelines
 # Η σειρά των numbers καθορίζει τη σειρά εκτέλεσης (μικρότερο = πρώτο)
 ITEM_PIPELINES = {
+    # Το JSONL backup γράφεται πρώτο - φθηνό streaming write, δεν
+    # εξαρτάται από το embedding/indexing
+    'scraper.pipelines.knowledge_pipeline.JsonExportPipeline': 200,
     'scraper.pipelines.knowledge_pipeline.KnowledgePipeline': 300,
-    'scraper.pipelines.knowledge_pipeline.JsonExportPipeline': 400,
 }
 
 # Enable and configure the AutoThrottle extension
@@ -9,6 +9,8 @@ import hashlib
 import re
 from datetime import datetime
 
+from selectolax.parser import HTMLParser
+
 
 class GeoteeSpider(scrapy.Spider):
     name = 'geotee'
@@ -28,7 +30,6 @@ class GeoteeSpider(scrapy.Spider):
     
     def __init__(self, *args, **kwargs):
         super(GeoteeSpider, self).__init__(*args, **kwargs)
-        self.visited_urls = set()
         self.scraped_count = 0
         
         # URLs που θέλουμε να αποφύγουμε
@@ -52,98 +53,105 @@ class GeoteeSpider(scrapy.Spider):
             r'\?replytocom=',
             r'/page/\d+/',  # Pagination
         ]
+
+        # Compiled regexes - μία φορά εδώ αντί για re-compile ανά URL/text node
+        # Όλα τα exclude patterns γίνονται ένα alternation: O(1) dispatch ανά URL
+        self._exclude_re = re.compile('(' + '|'.join(self.exclude_patterns) + ')', re.IGNORECASE)
+        self._ws_re = re.compile(r'\s+')
+        self._spaces_re = re.compile(r' +')
+        self._nl_re = re.compile(r'\n+')
+
+        # Base domain μία φορά εδώ - όχι urljoin+urlparse του base ανά link
+        self._base_netloc = urlparse(self.start_urls[0]).netloc.replace('www.', '')
     
     def parse(self, response):
         """
         Κύρια parsing function - επεξεργάζεται κάθε σελίδα
         """
-        # Έλεγχος αν η σελίδα έχει ήδη επισκεφθεί
-        if response.url in self.visited_urls:
-            return
-        
-        self.visited_urls.add(response.url)
+        # Το deduplication το κάνει ο built-in RFPDupeFilter του Scrapy -
+        # δεν κρατάμε δικό μας set από URLs στη μνήμη
         self.scraped_count += 1
-        
+
         # Log
         self.logger.info(f"Scraping [{self.scraped_count}]: {response.url}")
-        
-        # Εξαγωγή περιεχομένου
-        item = self.extract_content(response)
-        
+
+        # Περιεχόμενο και links με ένα πέρασμα στο δέντρο
+        item, links = self._parse_page(response)
+
         if item and item.get('text'):
             yield item
-        
+
         # Εύρεση και ακολούθηση links
-        for link in self.extract_links(response):
+        for link in links:
             if self.should_follow_link(link):
                 yield response.follow(link, callback=self.parse)
-    
-    def extract_content(self, response):
+
+    def _parse_page(self, response):
         """
-        Εξαγωγή χρήσιμου περιεχομένου από τη σελίδα
+        Εξαγωγή περιεχομένου ΚΑΙ links από ένα parse της σελίδας
+        Επιστρέφει (item ή None, set από cleaned links προς crawl)
         """
+        # Ένα selectolax δέντρο (C Modest engine) αντί για τα cssselect->
+        # XPath->lxml layers του response.css - πολύ φθηνότερο traversal
+        tree = HTMLParser(response.text)
+
+        # Anchors από το ίδιο δέντρο: cleaned set για το crawling και
+        # absolute internal links για το item, με ένα urljoin ανά anchor
+        crawl_links = set()
+        internal_links = []
+        for a in tree.css('a'):
+            href = a.attrs.get('href', '')
+            if not href or href.startswith('#'):
+                continue
+
+            if not self.is_internal_link(href):
+                continue
+
+            # Absolute, χωρίς fragment, χωρίς trailing slash
+            absolute_url = urljoin(response.url, href).split('#')[0].rstrip('/')
+            crawl_links.add(absolute_url)
+            internal_links.append(absolute_url)
+
         # Τίτλος σελίδας
-        title = response.css('title::text').get()
-        if not title:
-            title = response.css('h1::text').get()
-        title = self.clean_text(title) if title else ''
-        
+        title_node = tree.css_first('title') or tree.css_first('h1')
+        title = self.clean_text(title_node.text()) if title_node else ''
+
         # Meta description
-        meta_description = response.css('meta[name="description"]::attr(content)').get()
-        meta_description = self.clean_text(meta_description) if meta_description else ''
-        
-        # Κύριο περιεχόμενο - προσπάθησε διάφορα selectors
-        content_selectors = [
-            'article ::text',
-            '.content ::text',
-            '.main-content ::text',
-            '#content ::text',
-            'main ::text',
-            '.entry-content ::text',
-            '.post-content ::text',
-        ]
-        
-        text_content = []
-        for selector in content_selectors:
-            texts = response.css(selector).getall()
-            if texts:
-                text_content.extend(texts)
-                break
-        
-        # Αν δεν βρέθηκε με τα παραπάνω, πάρε όλο το body
-        if not text_content:
-            text_content = response.css('body ::text').getall()
-        
-        # Καθαρισμός κειμένου
-        text = ' '.join([self.clean_text(t) for t in text_content if t.strip()])
+        meta_node = tree.css_first('meta[name="description"]')
+        meta_description = self.clean_text(meta_node.attrs.get('content', '')) if meta_node else ''
+
+        # Πέτα scripts/styles ώστε να μην μολύνουν το text
+        # (και κατ' επέκταση τα embeddings)
+        for node in tree.css('script, style, noscript'):
+            node.decompose()
+
+        # Κύριο περιεχόμενο
+        text = tree.body.text(separator=' ') if tree.body else ''
         text = self.remove_extra_whitespace(text)
-        
+
         # Αποφυγή σελίδων με πολύ λίγο περιεχόμενο
+        # (τα links επιστρέφονται ούτως ή άλλως - το crawl συνεχίζει)
         if len(text) < 100:
             self.logger.debug(f"Skipping (too short): {response.url}")
-            return None
-        
+            return None, crawl_links
+
         # Εξαγωγή headings
-        headings = []
-        for h_level in range(1, 7):
-            headings.extend(response.css(f'h{h_level}::text').getall())
-        headings = [self.clean_text(h) for h in headings if h.strip()]
-        
-        # Εξαγωγή links
-        links = response.css('a::attr(href)').getall()
-        internal_links = [
-            urljoin(response.url, link) 
-            for link in links 
-            if link and self.is_internal_link(link, response.url)
+        headings = [
+            self.clean_text(h.text())
+            for h in tree.css('h1, h2, h3, h4, h5, h6')
         ]
+        headings = [h for h in headings if h]
         
-        # Δημιουργία unique ID
-        url_hash = hashlib.md5(response.url.encode()).hexdigest()
+        # Δημιουργία unique ID - blake2b-64 ως unsigned int: ταχύτερο από
+        # md5 και τα integer point IDs είναι μικρότερα στο Qdrant
+        url_hash = int.from_bytes(
+            hashlib.blake2b(response.url.encode(), digest_size=8).digest(), 'big'
+        )
         
         # Εξαγωγή category/section από URL
         category = self.extract_category(response.url)
         
-        return {
+        item = {
             'id': url_hash,
             'url': response.url,
             'title': title,
@@ -155,71 +163,39 @@ class GeoteeSpider(scrapy.Spider):
             'internal_links': internal_links[:10],  # Κράτα μόνο τα πρώτα 10
             'scraped_at': datetime.now().isoformat(),
         }
-    
-    def extract_links(self, response):
-        """
-        Εξαγωγή όλων των links από τη σελίδα
-        """
-        # CSS selectors για links
-        links = response.css('a::attr(href)').getall()
-        
-        # Καθαρισμός και normalization
-        cleaned_links = []
-        for link in links:
-            if not link or link.startswith('#'):
-                continue
-            
-            # Κάνε absolute URL
-            absolute_url = urljoin(response.url, link)
-            
-            # Αφαίρεση URL fragments
-            absolute_url = absolute_url.split('#')[0]
-            
-            # Αφαίρεση trailing slash για consistency
-            absolute_url = absolute_url.rstrip('/')
-            
-            cleaned_links.append(absolute_url)
-        
-        return set(cleaned_links)  # Unique links
-    
+
+        return item, crawl_links
+
     def should_follow_link(self, url):
         """
         Καθορίζει αν θα πρέπει να ακολουθήσει ένα link
+        Τα links από το _parse_page είναι ήδη internal - μένει μόνο
+        ο έλεγχος των exclude patterns (ένα fused regex)
         """
-        # Έλεγχος domain
-        if not self.is_internal_link(url, self.start_urls[0]):
+        if self._exclude_re.search(url):
             return False
-        
-        # Έλεγχος αν έχει ήδη επισκεφθεί
-        if url in self.visited_urls:
-            return False
-        
-        # Έλεγχος exclude patterns
-        for pattern in self.exclude_patterns:
-            if re.search(pattern, url, re.IGNORECASE):
-                return False
-        
+
         return True
     
-    def is_internal_link(self, link, base_url):
+    def is_internal_link(self, link):
         """
         Ελέγχει αν ένα link είναι internal (ίδιο domain)
+        Κάνει parse μόνο το link - κενό netloc σημαίνει relative, άρα
+        internal, αλλά μόνο για http(s): τα mailto:/tel:/javascript:
+        κάνουν parse με κενό netloc χωρίς να είναι σελίδες
         """
         if not link:
             return False
-        
-        # Κάνε absolute
-        absolute_link = urljoin(base_url, link)
-        
-        # Parse domains
-        link_domain = urlparse(absolute_link).netloc
-        base_domain = urlparse(base_url).netloc
-        
-        # Αφαίρεση www για σύγκριση
-        link_domain = link_domain.replace('www.', '')
-        base_domain = base_domain.replace('www.', '')
-        
-        return link_domain == base_domain
+
+        parsed = urlparse(link)
+        if parsed.scheme not in ('', 'http', 'https'):
+            return False
+
+        netloc = parsed.netloc
+        if not netloc:
+            return True
+
+        return netloc.replace('www.', '') == self._base_netloc
     
     def extract_category(self, url):
         """
@@ -243,15 +219,9 @@ class GeoteeSpider(scrapy.Spider):
         if not text:
             return ''
         
-        # Αφαίρεση HTML entities
-        text = text.strip()
-        
-        # Αφαίρεση extra whitespace
-        text = re.sub(r'\s+', ' ', text)
-        
-        # Αφαίρεση special characters που δεν χρειάζονται
-        text = re.sub(r'[\r\n\t]+', ' ', text)
-        
+        # Αφαίρεση extra whitespace (καλύπτει και \r\n\t)
+        text = self._ws_re.sub(' ', text)
+
         return text.strip()
     
     def remove_extra_whitespace(self, text):
@@ -259,11 +229,11 @@ class GeoteeSpider(scrapy.Spider):
         Αφαίρεση περιττών whitespaces
         """
         # Replace multiple spaces με ένα
-        text = re.sub(r' +', ' ', text)
-        
+        text = self._spaces_re.sub(' ', text)
+
         # Replace multiple newlines με ένα
-        text = re.sub(r'\n+', '\n', text)
-        
+        text = self._nl_re.sub('\n', text)
+
         return text.strip()
     
     def closed(self, reason):
@@ -272,4 +242,3 @@ class GeoteeSpider(scrapy.Spider):
         """
         self.logger.info(f"Spider closed: {reason}")
         self.logger.info(f"Total pages scraped: {self.scraped_count}")
-        self.logger.info(f"Total unique URLs: {len(self.visited_urls)}")